@@ -10,22 +10,32 @@ Column order is defined by daily_writer.py (COLUMNS).
 
 from __future__ import annotations
 
+import atexit
+import signal
+import threading
 import time
 import logging
-from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import yaml
 
+# Parser YAML en C (libyaml) si disponible, beaucoup plus rapide sur un Pi
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
 # Importation des capteurs qu'on veut mesurer
 from sensors.pms import PMSReader # Il y en a 2
 from sensors.bme import read_bme
-from sensors.so2 import init_so2, read_so2
+from sensors.so2 import init_so2, read_so2, stop_so2
 # from sensors.opc_n3 import OPCN3
 
 from utils.timekeeping import now_utc, utc_to_local, isoformat_utc_z, isoformat_local
-from daily_writer import DailyWriter
+from utils.rolling_median import RollingMedian
+from daily_writer import DailyWriter, BufferedDailyWriter
 
 def load_config(root: Path) -> Dict[str, Any]:
     """
@@ -38,7 +48,7 @@ def load_config(root: Path) -> Dict[str, Any]:
     """
     cfg_path = root / "config" / "node.yaml"
     with cfg_path.open("r", encoding="utf-8") as f:
-        return yaml.safe_load(f) or {}
+        return yaml.load(f, Loader=_YamlLoader) or {}
 
 def setup_logging(root: Path) -> logging.Logger:
     """
@@ -71,6 +81,9 @@ BASELINE_N = 30      # rolling baseline length (samples)
 MIN_PM = 1.0         # below this, don't overreact to mismatch
 RPD_OK = 0.25        # <= 25% relative percent difference = OK
 
+# Particules lues sur chaque capteur PMS (clés du dict retourné par PMSReader.read)
+PM_SPECIES = ("pm1", "pm25", "pm10")
+
 
 def rpd(a: float, b: float) -> Optional[float]:
     """
@@ -90,22 +103,55 @@ def rpd(a: float, b: float) -> Optional[float]:
     # Donc écart-type relatif de 18.18%
     return abs(a - b) / m
 
-def median(xs : list[float]) -> Optional[float]:
+
+def classify_pair(
+    pm1: float, pm2: float, hist1: RollingMedian, hist2: RollingMedian
+) -> Tuple[str, Optional[str], float, Optional[float]]:
     """
-    Calculer la médiane d'une liste de nombres
-    
-    :param xs: Liste de nombres
-    :type xs: list[float]
-    :return: Médiane des nombres, ou None si la liste est vide
-    :rtype: float | None
+    Comparer les mesures PM2.5 de 2 capteurs PMS qui sont tous les deux "ok"
+
+    :param pm1: PM2.5 du capteur PMS1
+    :type pm1: float
+    :param pm2: PM2.5 du capteur PMS2
+    :type pm2: float
+    :param hist1: Historique des mesures valides du capteur PMS1
+    :type hist1: RollingMedian
+    :param hist2: Historique des mesures valides du capteur PMS2
+    :type hist2: RollingMedian
+    :return: (pair_flag, capteur suspect ou None, moyenne, écart-type relatif ou None si pas calculé)
+    :rtype: Tuple[str, str | None, float, float | None]
     """
-    xs = sorted(xs)
-    n = len(xs)
-    if n == 0:
-        return None
-    # Si n est impair, on prend le nombre du milieu
-    # Si n est pair, on fait la moyenne des 2 nombres du milieu
-    return xs[n // 2] if n % 2 else 0.5 * (xs[n // 2 - 1] + xs[n // 2])
+    # Moyenne des données PM2.5 des 2 capteurs
+    mean_pm = 0.5 * (pm1 + pm2)
+
+    # Si la moyenne est trop basse, on ne compare pas les capteurs
+    if mean_pm < MIN_PM:
+        return "LOW_PM_OK", None, mean_pm, None
+
+    # Calcul de l'écart-type relatif entre les 2 capteurs PMS
+    d = rpd(pm1, pm2)
+
+    # Si l'écart-type relatif est dans la plage acceptable, on marque "OK"
+    if d is not None and d <= RPD_OK:
+        return "OK", None, mean_pm, d
+
+    # Aussi non, vérifier quel capteur est en faute en comparant aux valeurs médianes historiques
+    b1 = hist1.median()
+    b2 = hist2.median()
+
+    # Écart-type relatif par rapport aux valeurs médianes historiques
+    dev1 = abs(pm1 - b1) / max(b1, MIN_PM) if b1 is not None else 0.0
+    dev2 = abs(pm2 - b2) / max(b2, MIN_PM) if b2 is not None else 0.0
+
+    # Si l'écart-type relatif d'un capteur est 50% plus grand que l'autre, on marque le capteur comme suspect
+    if dev1 > dev2 * 1.5:
+        suspect = "PMS1"
+    elif dev2 > dev1 * 1.5:
+        suspect = "PMS2"
+    else:
+        suspect = "BOTH"
+
+    return "MISMATCH", suspect, mean_pm, d
 
 
 def main() -> None:
@@ -118,48 +164,41 @@ def main() -> None:
     node_id: str = cfg.get("node_id", "NodeX")
     tz_name: str = cfg.get("timezone", "UTC")
     tick_seconds: float = float(cfg.get("tick_seconds", 1.0)) # Délai entre chaque boucle de collecte de données
+    batch_rows: int = int(cfg.get("batch_rows", 60)) # Nombre de lignes gardées en mémoire avant d'écrire dans le CSV
+    flush_seconds: float = float(cfg.get("flush_seconds", 60.0)) # Délai maximal avant d'écrire les lignes en mémoire dans le CSV
+    staging_dir: Optional[str] = cfg.get("staging_dir") # Dossier en RAM (ex: /dev/shm) pour le CSV du jour, pour épargner la carte SD
+    snapshot_seconds: float = float(cfg.get("snapshot_seconds", 300.0)) # Délai entre les copies du CSV du jour vers data/daily
 
     s_cfg: Dict[str, Any] = cfg.get("sensors", {}) # Récupération de la configuration des capteurs s'il y en a
 
     # Rolling baselines for PMS diagnostics
     # Permet d'avoir une idée des valeurs habituelles des capteurs PMS pour détecter les anomalies (30 dernières mesures stockées)
-    pms1_hist : deque[float] = deque(maxlen=BASELINE_N)
-    pms2_hist : deque[float] = deque(maxlen=BASELINE_N)
+    # La médiane est mise à jour à chaque ajout, sans retrier l'historique
+    pms1_hist = RollingMedian(maxlen=BASELINE_N)
+    pms2_hist = RollingMedian(maxlen=BASELINE_N)
 
     # -----------------------
     # Initialise sensors
     # -----------------------
-    pms1_reader: Optional[PMSReader] = None
-    pms2_reader: Optional[PMSReader] = None
     # opc_reader: Optional[OPCN3] = None
 
-    # TODO: Faire une fonction pour les capteurs pms (répétition de code car connexion serial)
-    
-    ### PMS1
-    # Récupération de la configuration du capteur PMS1
-    p1 = s_cfg.get("pms1", {})
-
-    # Instantier le lecteur PMS1 si activé dans la config
-    if p1.get("enabled", False):
-        port = p1.get("port")
-        if port:
-            pms1_reader = PMSReader(port)
-            log.info(f"PMS1 enabled on {port}")
-        else:
-            log.warning("PMS1 enabled but no port provided; disabling")
-
-    ### PMS2
-    # Récupération de la configuration du capteur PMS2
-    p2 = s_cfg.get("pms2", {})
-
-    # Instantier le lecteur PMS2 si activé dans la config
-    if p2.get("enabled", False):
-        port = p2.get("port")
-        if port:
-            pms2_reader = PMSReader(port)
-            log.info(f"PMS2 enabled on {port}")
-        else:
-            log.warning("PMS2 enabled but no port provided; disabling")
+    ### PMS1 / PMS2
+    # Capteurs PMS activés: (nom, lecteur, colonnes PM dans l'ordre de PM_SPECIES, colonne de statut)
+    # Les noms de colonnes sont calculés une seule fois ici plutôt qu'à chaque boucle
+    pms_sensors: List[Tuple[str, PMSReader, Tuple[str, ...], str]] = []
+    for tag in ("pms1", "pms2"):
+        # Récupération de la configuration du capteur PMS
+        p_cfg = s_cfg.get(tag, {})
+
+        # Instantier le lecteur PMS si activé dans la config
+        if p_cfg.get("enabled", False):
+            port = p_cfg.get("port")
+            if port:
+                cols = tuple(f"{species}_atm_{tag}" for species in PM_SPECIES)
+                pms_sensors.append((tag, PMSReader(port), cols, f"{tag}_status"))
+                log.info(f"{tag.upper()} enabled on {port}")
+            else:
+                log.warning(f"{tag.upper()} enabled but no port provided; disabling")
 
     # TODO: Faire une fonction pour les capteurs de BME688 et SO2 (répétition de code car connexion I2C)
 
@@ -199,12 +238,51 @@ def main() -> None:
             so2_enabled = False
 
     # Daily writer
-    dw = DailyWriter(root_dir=root, node_id=node_id, tz_name=tz_name)
+    # Les lignes sont gardées en mémoire et écrites par paquets pour éviter d'écrire sur la carte SD à chaque boucle
+    dw = BufferedDailyWriter(
+        writer=DailyWriter(
+            root_dir=root,
+            node_id=node_id,
+            tz_name=tz_name,
+            staging_dir=Path(staging_dir) if staging_dir else None,
+            snapshot_interval_s=snapshot_seconds,
+        ),
+        batch_size=batch_rows,
+        flush_interval_s=flush_seconds,
+    )
+    # Filet de sécurité: écrire les lignes en attente si le programme se termine autrement
+    atexit.register(dw.close)
+
+    # systemd arrête le service avec SIGTERM, qui par défaut tue Python sans passer par finally/atexit.
+    # Le handler ne lève pas d'exception (elle pourrait tomber au milieu d'une écriture et faire écrire
+    # les mêmes lignes deux fois): il demande l'arrêt, et la boucle s'arrête entre deux lectures
+    stop = threading.Event()
+
+    def _request_stop(signum: int, frame: Any) -> None:
+        log.info(f"Stopping collection loop ({signal.Signals(signum).name})")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
     log.info("Starting collection loop (daily CSV only)")
 
+    # Les capteurs sont lus en parallèle: la durée d'une boucle est celle du capteur le plus lent, pas la somme des capteurs
+    pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="emis-sensor")
+
     # Main loop de la collecte de données des capteurs 
     try:
-        while True:
+        while not stop.is_set():
+            tick_start = time.monotonic()
+
+            # Lancer la lecture de tous les capteurs activés en même temps
+            reads: Dict[str, Future] = {}
+            if bme_enabled:
+                reads["bme"] = pool.submit(read_bme, bus=bme_bus, address=bme_addr)
+            for tag, reader, _, _ in pms_sensors:
+                reads[tag] = pool.submit(reader.read)
+            if so2_enabled:
+                reads["so2"] = pool.submit(read_so2)
+
             # Récupérer les données actuel
             t_utc = now_utc()
             t_local = utc_to_local(t_utc, tz_name)
@@ -220,7 +298,7 @@ def main() -> None:
             # Lire les données du capteur BME s'il est activé
             if bme_enabled:
                 try:
-                    b = read_bme(bus=bme_bus, address=bme_addr)
+                    b = reads["bme"].result()
                     if b:
                         row["temp_c"] = b.get("temp_c")
                         row["rh_pct"] = b.get("rh_pct")
@@ -233,39 +311,20 @@ def main() -> None:
                     row["bme_status"] = f"error:{e}"
                     log.warning(f"BME read error: {e}")
 
-            # TODO: Faire une fonction pour la lacture des capteurs PMS (répétition de code car même type de données)
-
-            # ---- PMS1 ----
-            # Lire les données du capteur PMS1 s'il est activé
-            if pms1_reader is not None:
-                try:
-                    s1 = pms1_reader.read()
-                    if s1:
-                        row["pm1_atm_pms1"] = s1.get("pm1")
-                        row["pm25_atm_pms1"] = s1.get("pm25")
-                        row["pm10_atm_pms1"] = s1.get("pm10")
-                        row["pms1_status"] = "ok"
-                    else:
-                        row["pms1_status"] = "no_frame"
-                except Exception as e:
-                    row["pms1_status"] = f"error:{e}"
-                    log.warning(f"PMS1 read error: {e}")
-
-            # ---- PMS2 ----
-            # Lire les données du capteur PMS2 s'il est activé
-            if pms2_reader is not None:
+            # ---- PMS1 / PMS2 ----
+            # Lire les données des capteurs PMS activés
+            for tag, _, cols, status_col in pms_sensors:
                 try:
-                    s2 = pms2_reader.read()
-                    if s2:
-                        row["pm1_atm_pms2"] = s2.get("pm1")
-                        row["pm25_atm_pms2"] = s2.get("pm25")
-                        row["pm10_atm_pms2"] = s2.get("pm10")
-                        row["pms2_status"] = "ok"
+                    sample = reads[tag].result()
+                    if sample:
+                        for species, col in zip(PM_SPECIES, cols):
+                            row[col] = sample.get(species)
+                        row[status_col] = "ok"
                     else:
-                        row["pms2_status"] = "no_frame"
+                        row[status_col] = "no_frame"
                 except Exception as e:
-                    row["pms2_status"] = f"error:{e}"
-                    log.warning(f"PMS2 read error: {e}")
+                    row[status_col] = f"error:{e}"
+                    log.warning(f"{tag.upper()} read error: {e}")
 
             # ---- PMS pair diagnostics (PM2.5) ----
             # TODO: Vérifier pourquoi on vérifie seulement les données du PM2.5 et pas les autres (PM1.0, PM10) 
@@ -281,20 +340,16 @@ def main() -> None:
             st1 = row.get("pms1_status", "")
             st2 = row.get("pms2_status", "")
 
+            # PMSReader retourne des int; tout autre type (ex: None) n'est pas une mesure utilisable
+            pm1_ok = isinstance(pm1, (int, float))
+            pm2_ok = isinstance(pm2, (int, float))
+
             # Update rolling baselines from "ok" readings
             # Ajouter la nouvelle valeur valide à l'historique pour le calcul de la médiane
-            # TODO: Faire une fonction pour éviter la répétition de code
-            if st1 == "ok" and pm1 is not None:
-                try:
-                    pms1_hist.append(float(pm1))
-                except Exception:
-                    pass
-
-            if st2 == "ok" and pm2 is not None:
-                try:
-                    pms2_hist.append(float(pm2))
-                except Exception:
-                    pass
+            if st1 == "ok" and pm1_ok:
+                pms1_hist.append(float(pm1))
+            if st2 == "ok" and pm2_ok:
+                pms2_hist.append(float(pm2))
 
             # Status-first logic
             # Déterminer si les 2 capteurs PMS sont d'accord sur les mesures de PM2.5 et déterminer si l'un des 2 capteurs est défectueux
@@ -307,50 +362,15 @@ def main() -> None:
             elif st2 != "ok":
                 row["pm25_pair_flag"] = "PMS2_BAD"
                 row["pm25_suspect_sensor"] = "PMS2"
-            elif pm1 is not None and pm2 is not None:
-                try:
-                    # Les deux capteurs sont "ok", on peut donc comparer leurs valeurs pour voir si elles sont similaires
-                    pm1f = float(pm1)
-                    pm2f = float(pm2)
-
-                    # Moyenne des données PM2.5 des 2 capteurs
-                    mean_pm = 0.5 * (pm1f + pm2f)
-                    row["pm25_pms_mean"] = mean_pm
-
-                    # Comparaison des données PM2.5 des 2 capteurs
-                    # Si la moyenne est suffisamment élevée, on calcule l'écart-type relatif (RPD)
-                    if mean_pm >= MIN_PM:
-                        # Calcul de l'écart-type relatif entre les 2 capteurs PMS
-                        d = rpd(pm1f, pm2f)
-                        row["pm25_pms_rpd"] = d
-
-                        # Si l'écart-type relatif est dans la plage acceptable, on marque "OK"
-                        if d is not None and d <= RPD_OK:
-                            row["pm25_pair_flag"] = "OK"
-                        else:
-                            # Aussi non, vérifier quel capteur est en faute en comparant aux valeurs médianes historiques
-                            b1 = median(list(pms1_hist))
-                            b2 = median(list(pms2_hist))
-
-                            # Écart-type relatif par rapport aux valeurs médianes historiques
-                            dev1 = abs(pm1f - b1) / max(b1, MIN_PM) if b1 is not None else 0.0
-                            dev2 = abs(pm2f - b2) / max(b2, MIN_PM) if b2 is not None else 0.0
-
-                            row["pm25_pair_flag"] = "MISMATCH"
-
-                            # Si l'écart-type relatif d'un capteur est 50% plus grand que l'autre, on marque le capteur comme suspect
-                            if dev1 > dev2 * 1.5:
-                                row["pm25_suspect_sensor"] = "PMS1"
-                            elif dev2 > dev1 * 1.5:
-                                row["pm25_suspect_sensor"] = "PMS2"
-                            else:
-                                row["pm25_suspect_sensor"] = "BOTH"
-                    else:
-                        row["pm25_pair_flag"] = "LOW_PM_OK"
-
-                except Exception:
-                    row["pm25_pair_flag"] = "ERROR"
-                    row["pm25_suspect_sensor"] = "UNKNOWN"
+            elif pm1_ok and pm2_ok:
+                # Les deux capteurs sont "ok", on peut donc comparer leurs valeurs pour voir si elles sont similaires
+                flag, suspect, mean_pm, d = classify_pair(float(pm1), float(pm2), pms1_hist, pms2_hist)
+                row["pm25_pms_mean"] = mean_pm
+                row["pm25_pair_flag"] = flag
+                if d is not None:
+                    row["pm25_pms_rpd"] = d
+                if suspect is not None:
+                    row["pm25_suspect_sensor"] = suspect
             else:
                 # Not enough data to compare (e.g., one PM missing but status ok)
                 row["pm25_pair_flag"] = "INCOMPLETE"
@@ -364,13 +384,13 @@ def main() -> None:
             # Si le capteur de SO2 est activé, on lit les données
             if so2_enabled:
                 try:
-                    v = read_so2()
-                    row["so2_ppm"]   = v.get("so2_ppm")
-                    row["so2_raw"]   = v.get("so2_raw")
-                    row["so2_byte0"] = v.get("so2_byte0")
-                    row["so2_byte1"] = v.get("so2_byte1")
-                    row["so2_error"] = v.get("so2_error")     # "OK" if fine
-                    row["so2_status"] = v.get("so2_status")   # "ok" or "error"
+                    v = reads["so2"].result()
+                    row["so2_ppm"]   = v.so2_ppm
+                    row["so2_raw"]   = v.so2_raw
+                    row["so2_byte0"] = v.so2_byte0
+                    row["so2_byte1"] = v.so2_byte1
+                    row["so2_error"] = v.so2_error     # "OK" if fine
+                    row["so2_status"] = v.so2_status   # "ok" or "error"
                 except Exception as e:
                     row["so2_ppm"] = "NODATA"
                     row["so2_error"] = f"exception:{e}"
@@ -379,19 +399,20 @@ def main() -> None:
 
 
             # Write
-            # Écrire la ligne de données dans le fichier CSV quotidien
+            # Ajouter la ligne de données au fichier CSV quotidien (écrite par paquets)
             dw.write_sample(row=row, sample_time_utc=t_utc)
-            time.sleep(tick_seconds)
 
-    except KeyboardInterrupt:
-        log.info("Stopping collection loop (KeyboardInterrupt)")
+            # Attendre le reste du délai (le temps de lecture des capteurs est déjà écoulé)
+            # wait() plutôt que sleep(): se réveille tout de suite si on demande l'arrêt
+            stop.wait(max(0.0, tick_seconds - (time.monotonic() - tick_start)))
 
     finally:
+        # Les lignes en attente sont écrites par dw.close()
+        pool.shutdown(wait=True)
+        stop_so2()
         dw.close()
-        if pms1_reader is not None:
-            pms1_reader.close()
-        if pms2_reader is not None:
-            pms2_reader.close()
+        for _, reader, _, _ in pms_sensors:
+            reader.close()
         log.info("Shutdown complete")
 
 
@@ -4,15 +4,26 @@ DailyWriter: write samples directly into one rolling daily CSV per node.
 
 - File path: data/daily/<node_id>_YYYY-MM-DD.csv (local date)
 - Appends one row per sample in a fixed column order.
+- BufferedDailyWriter batches samples in memory and hands them to
+  DailyWriter in one write, so the SD card isn't hit on every tick.
+- Optional staging_dir (e.g. a tmpfs like /dev/shm): today's file is
+  written there instead. Every snapshot_interval_s, and when the day rolls
+  over or the writer closes, the bytes added since the last snapshot are
+  appended to the copy in data/daily/, which can therefore lag the staged
+  file by up to snapshot_interval_s.
 """
 
 from __future__ import annotations
 
 import csv
+import io
+import os
+import shutil
+import time
 from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import BinaryIO, Optional, Dict, Any, Iterable, Iterator, List, Sequence, Tuple
 
 from utils.timekeeping import utc_to_local
 
@@ -64,67 +75,228 @@ COLUMNS = [
 ]
 
 
+def _encode_rows(rows: Iterable[Sequence[Any]]) -> bytes:
+    """Render rows as CSV and encode them to UTF-8 in one go."""
+    buf = io.StringIO(newline="")
+    csv.writer(buf).writerows(rows)
+    return buf.getvalue().encode("utf-8")
+
+
+# The header never changes, so it is encoded once
+_HEADER_BYTES = _encode_rows([COLUMNS])
+
+
+@dataclass
+class ColumnBuffers:
+    """
+    Pending samples stored column by column (one list per entry of COLUMNS).
+
+    Values are normalised on append: missing columns become "NODATA" and
+    None becomes "" (blank CSV cell).
+    """
+    columns: List[List[Any]] = field(default_factory=lambda: [[] for _ in COLUMNS])
+
+    def __len__(self) -> int:
+        return len(self.columns[0])
+
+    def append(self, row: Dict[str, Any]) -> None:
+        """Add one sample dict to the end of every column."""
+        for col, values in zip(COLUMNS, self.columns):
+            val = row.get(col, "NODATA")
+            values.append("" if val is None else val)
+
+    def rows(self) -> Iterator[Tuple[Any, ...]]:
+        """Iterate samples as tuples in COLUMNS order."""
+        return zip(*self.columns)
+
+    def clear(self) -> None:
+        for values in self.columns:
+            values.clear()
+
+
 @dataclass
 class DailyWriter:
     root_dir: Path
     node_id: str
     tz_name: str
+    staging_dir: Optional[Path] = None      # None: write straight into data_dir
+    snapshot_interval_s: float = 300.0      # copy staged file to data_dir this often
 
     data_dir: Path = field(init=False)
     _current_date_str: Optional[str] = field(default=None, init=False)
-    _file: Optional[object] = field(default=None, init=False)
-    _writer: Optional[csv.writer] = field(default=None, init=False)
+    _file: Optional[BinaryIO] = field(default=None, init=False)
     _current_path: Optional[Path] = field(default=None, init=False)
+    _last_snapshot: float = field(default_factory=time.monotonic, init=False)
+    _snapshot_offset: int = field(default=0, init=False)  # bytes of the staged file already in data_dir
 
     def __post_init__(self) -> None:
         self.data_dir = self.root_dir / "data" / "daily"
         self.data_dir.mkdir(parents=True, exist_ok=True)
+        if self.staging_dir is not None:
+            self.staging_dir = Path(self.staging_dir)
+            self.staging_dir.mkdir(parents=True, exist_ok=True)
 
     def _open_for_date(self, date_str: str) -> None:
         """Open (or create) the daily CSV for the given YYYY-MM-DD date_str."""
         self.close()
 
-        path = self.data_dir / f"{self.node_id}_{date_str}.csv"
+        name = f"{self.node_id}_{date_str}.csv"
+        if self.staging_dir is None:
+            path = self.data_dir / name
+        else:
+            path = self.staging_dir / name
+            final = self.data_dir / name
+            # Fichiers d'autres jours laissés en RAM par un crash: on les recopie avant de les oublier
+            self._recover_staged(keep=path)
+            # After a restart (tmpfs is wiped on reboot), resume from the copy in data_dir
+            if not path.exists() and final.exists():
+                shutil.copyfile(final, path)
+            self._snapshot_offset = self._synced_bytes(path)
+            self._last_snapshot = time.monotonic()
         is_new = not path.exists()
 
-        f = path.open("a", encoding="utf-8", newline="")
-        writer = csv.writer(f)
+        # Binary mode: rows are already CSV-rendered and UTF-8 encoded by _encode_rows
+        f = path.open("ab")
 
         if is_new:
-            writer.writerow(COLUMNS)
+            f.write(_HEADER_BYTES)
             f.flush()
 
         self._file = f
-        self._writer = writer
         self._current_date_str = date_str
         self._current_path = path
 
+    def date_for(self, sample_time_utc: datetime) -> str:
+        """Return the local YYYY-MM-DD date_str a sample belongs to."""
+        return utc_to_local(sample_time_utc, self.tz_name).date().isoformat()
+
     def write_sample(self, row: Dict[str, Any], sample_time_utc: datetime) -> None:
         """
         Append one sample to today's file (local date based on tz_name).
         """
-        local_dt = utc_to_local(sample_time_utc, self.tz_name)
-        date_str = local_dt.date().isoformat()
+        batch = ColumnBuffers()
+        batch.append(row)
+        self.write_batch(batch, self.date_for(sample_time_utc))
 
-        if self._current_date_str != date_str or self._file is None or self._writer is None:
-            self._open_for_date(date_str)
+    def write_batch(self, batch: ColumnBuffers, date_str: str) -> None:
+        """
+        Append a batch of samples to the daily file for date_str.
 
-        out = []
-        for col in COLUMNS:
-            val = row.get(col, "NODATA")
-            if val is None:
-                val = ""
-            out.append(val)
+        The whole batch is rendered and encoded in memory first, then
+        written with a single write + flush + fsync. When staging, the
+        fsync is skipped (tmpfs) and a snapshot is taken if one is due.
+        """
+        if self._current_date_str != date_str or self._file is None:
+            self._open_for_date(date_str)
 
-        self._writer.writerow(out)
+        self._file.write(_encode_rows(batch.rows()))
         self._file.flush()
 
+        if self.staging_dir is None:
+            os.fsync(self._file.fileno())
+        elif time.monotonic() - self._last_snapshot >= self.snapshot_interval_s:
+            self._snapshot()
+
+    def _synced_bytes(self, staged: Path) -> int:
+        """Size of the data_dir copy of staged, i.e. how much of it is already on the SD card."""
+        final = self.data_dir / staged.name
+        return final.stat().st_size if final.exists() else 0
+
+    def _append_to_data_dir(self, staged: Path, offset: int) -> int:
+        """
+        Append the bytes of staged past offset to its copy in data_dir, fsync,
+        and return the new offset.
+
+        The copy in data_dir is always a prefix of the staged file (it starts
+        as a copy of it and only ever gets its tail appended), so each
+        snapshot writes only what is new, not the whole day.
+        """
+        with staged.open("rb") as src:
+            src.seek(offset)
+            new = src.read()
+        if new:
+            with (self.data_dir / staged.name).open("ab") as dst:
+                dst.write(new)
+                dst.flush()
+                os.fsync(dst.fileno())
+        return offset + len(new)
+
+    def _snapshot(self) -> None:
+        """Append what was staged since the last snapshot to the daily file in data_dir."""
+        if self._current_path is None:
+            return
+        self._snapshot_offset = self._append_to_data_dir(self._current_path, self._snapshot_offset)
+        self._last_snapshot = time.monotonic()
+
+    def _recover_staged(self, keep: Path) -> None:
+        """Copy staged files other than keep (left by a crash) into data_dir, then remove them."""
+        for staged in self.staging_dir.glob(f"{self.node_id}_*.csv"):
+            if staged == keep:
+                continue
+            self._append_to_data_dir(staged, self._synced_bytes(staged))
+            staged.unlink()
+
     def close(self) -> None:
-        """Close the current daily file, if open."""
+        """
+        Close the current daily file, if open. When staging, the final copy
+        is written to data_dir and the staged file is removed.
+        """
         if self._file is not None:
             self._file.flush()
             self._file.close()
+            if self.staging_dir is not None and self._current_path is not None:
+                self._snapshot()
+                self._current_path.unlink(missing_ok=True)
         self._file = None
-        self._writer = None
         self._current_path = None
         self._current_date_str = None
+
+
+@dataclass
+class BufferedDailyWriter:
+    """
+    Keeps pending samples in memory and writes them to the DailyWriter in
+    batches: once batch_size rows are pending, once flush_interval_s has
+    elapsed since the last flush, or when the local date changes.
+
+    Call flush()/close() on shutdown, otherwise pending rows are lost.
+    """
+    writer: DailyWriter
+    batch_size: int = 60
+    flush_interval_s: float = 60.0
+
+    _pending: ColumnBuffers = field(default_factory=ColumnBuffers, init=False)
+    _pending_date_str: Optional[str] = field(default=None, init=False)
+    _last_flush: float = field(default_factory=time.monotonic, init=False)
+
+    def write_sample(self, row: Dict[str, Any], sample_time_utc: datetime) -> None:
+        """
+        Queue one sample; flushes the batch when it is due.
+        """
+        date_str = self.writer.date_for(sample_time_utc)
+
+        # A batch never spans two daily files
+        if self._pending and date_str != self._pending_date_str:
+            self.flush()
+
+        self._pending.append(row)
+        self._pending_date_str = date_str
+
+        if (
+            len(self._pending) >= self.batch_size
+            or time.monotonic() - self._last_flush >= self.flush_interval_s
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """Write all pending samples to the daily file."""
+        if self._pending and self._pending_date_str is not None:
+            self.writer.write_batch(self._pending, self._pending_date_str)
+        self._pending.clear()
+        self._pending_date_str = None
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        """Flush pending samples and close the daily file. Safe to call twice."""
+        self.flush()
+        self.writer.close()
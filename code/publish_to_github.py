@@ -23,11 +23,17 @@ from typing import Dict, Any
 import yaml
 from zoneinfo import ZoneInfo
 
+# Parser YAML en C (libyaml) si disponible, beaucoup plus rapide sur un Pi
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
 
 def load_config(root: Path) -> Dict[str, Any]:
     cfg_path = root / "config" / "node.yaml"
     with cfg_path.open("r", encoding="utf-8") as f:
-        return yaml.safe_load(f)
+        return yaml.load(f, Loader=_YamlLoader)
 
 
 def setup_logging(root: Path) -> logging.Logger:
@@ -16,12 +16,20 @@ Important detail:
 from __future__ import annotations
 
 import csv
+import io
+import os
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional
 
 import yaml
 
+# Parser YAML en C (libyaml) si disponible, beaucoup plus rapide sur un Pi
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
 # --- ANSI styling (works over SSH terminals) ---
 RESET = "\033[0m"
 BOLD = "\033[1m"
@@ -50,10 +58,17 @@ SENSORS: List[Tuple[str, List[str], Optional[str]]] = [
 ]
 
 
+# Cell values (after strip + lower) that do NOT count as present
+_EMPTY = frozenset({"", "na", "nan", "none", "null"})
+
+# Bytes read from the end of the daily CSV to find the last row (doubled until a full row fits)
+TAIL_BYTES = 8192
+
+
 def load_config(root: Path) -> Dict:
     cfg_path = root / "config" / "node.yaml"
     with cfg_path.open("r", encoding="utf-8") as f:
-        return yaml.safe_load(f) or {}
+        return yaml.load(f, Loader=_YamlLoader) or {}
 
 
 def today_local_datestr() -> str:
@@ -68,37 +83,54 @@ def newest_daily_file(daily_dir: Path, node_id: str) -> Optional[Path]:
     if p.exists():
         return p
 
-    candidates = sorted(
-        daily_dir.glob(f"{node_id}_*.csv"),
-        key=lambda x: x.stat().st_mtime,
-        reverse=True,
-    )
-    return candidates[0] if candidates else None
+    # Filenames end in an ISO date (YYYY-MM-DD), so the largest name is the newest day; no stat() needed
+    return max(daily_dir.glob(f"{node_id}_*.csv"), key=lambda x: x.name, default=None)
 
 
 def read_header_and_last_row(path: Path) -> Tuple[List[str], Dict[str, str]]:
     """
     Returns (header_columns, last_row_map).
     last_row_map maps column_name -> last_row_value (stripped).
-    """
-    with path.open("r", encoding="utf-8", newline="") as f:
-        reader = csv.reader(f)
-        header = next(reader, [])
-        last: Optional[List[str]] = None
-        for row in reader:
-            if row:
-                last = row
 
-        if not header or last is None:
-            return header, {}
+    Only the first line and the end of the file are read, so the cost does
+    not grow with the number of rows recorded today.
+    """
+    with path.open("rb") as f:
+        header = next(csv.reader([f.readline().decode("utf-8")]), [])
+        data_start = f.tell()
+        size = f.seek(0, os.SEEK_END)
 
-        n = min(len(header), len(last))
-        header = header[:n]
-        last = last[:n]
-        return header, {
-            header[i]: (last[i].strip() if last[i] is not None else "")
-            for i in range(n)
-        }
+        last: Optional[List[str]] = None
+        window = TAIL_BYTES
+        while True:
+            start = max(data_start, size - window)
+            f.seek(start)
+            tail = f.read(size - start).decode("utf-8", errors="replace")
+            try:
+                # csv.reader, not splitlines(): a quoted cell (ex: an error message) may contain newlines
+                records = [r for r in csv.reader(io.StringIO(tail, newline="")) if r]
+            except csv.Error:
+                records = []
+            if start == data_start:
+                last = records[-1] if records else None
+                break
+            # The tail may start in the middle of a record, even inside a quoted cell: drop the first
+            # record, and only trust the last one if it has as many cells as the header
+            if len(records) >= 2 and len(records[-1]) == len(header):
+                last = records[-1]
+                break
+            window *= 2
+
+    if not header or last is None:
+        return header, {}
+
+    n = min(len(header), len(last))
+    header = header[:n]
+    last = last[:n]
+    return header, {
+        header[i]: (last[i].strip() if last[i] is not None else "")
+        for i in range(n)
+    }
 
 
 def is_present_value(v: str) -> bool:
@@ -108,25 +140,19 @@ def is_present_value(v: str) -> bool:
     - Empty string -> not present
     - "na", "nan", "none", "null" (case-insensitive) -> not present
     - "0" / "0.0" / etc -> PRESENT (important!)
+
+    v must already be stripped, as read_header_and_last_row does.
     """
-    if v is None:
-        return False
-    s = str(v).strip()
-    if s == "":
-        return False
-    if s.lower() in ("na", "nan", "none", "null"):
-        return False
-    return True
+    return v.lower() not in _EMPTY
 
 
 def any_present(vals: Dict[str, str], cols: List[str]) -> bool:
     """
     True if ANY of the specified columns has a present value.
+
+    vals must come from read_header_and_last_row (values already stripped).
     """
-    for c in cols:
-        if is_present_value(vals.get(c, "")):
-            return True
-    return False
+    return any(is_present_value(vals.get(c, "")) for c in cols)
 
 
 def main() -> None:
@@ -163,7 +189,7 @@ def main() -> None:
 
         # 2) Value + status extraction
         values_present = any_present(last_vals, cols)
-        status_val = last_vals.get(status_col, "").strip() if status_col else ""
+        status_val = last_vals.get(status_col, "") if status_col else ""
 
         # 3) PMS-specific: status-driven truth
         if name.startswith("PMS"):
@@ -2,7 +2,8 @@
 """
 BME688 reader using the bme680 Python library.
 
-Exposes read_bme(bus, address) -> dict or None.
+Exposes read_bme(bus, address) -> dict or None, a bound method of a
+module-level BMEReader that keeps the sensor between calls.
 
 Returns (if successful):
     {
@@ -16,66 +17,93 @@ For more informations about the sensor's specifications, please look at:
 https://www.bosch-sensortec.com/media/boschsensortec/downloads/datasheets/bst-bme688-ds000.pdf
 """
 
+from __future__ import annotations
+
 import bme680
 
-# We keep a single global sensor instance so we don't re-init on every call.
-_sensor: bme680.BME680 | None = None
+from sensors.bus import get_bus
+
 
-def _ensure_sensor(address: int = 0x76) -> bme680.BME680:
+class BMEReader:
     """
-    Initialize the BME680/BME688 sensor if needed and return it.
+    Keeps BME680/BME688 sensors between reads, so nothing is re-initialised
+    on every call.
+
+    Sensors talk through the shared handle from sensors.bus (bme680 reads
+    all the measurement registers in one block read through it). The bus
+    lock is held for the whole init and for the whole get_sensor_data()
+    call, which includes the forced-mode measurement wait (bme680 polls
+    the status register with 10 ms sleeps), so an SO2 read on the same bus
+    waits until the BME measurement is done.
     """
-    if _sensor is None:
-        # i2c_addr uses /dev/i2c-1 by default on a Pi
-        sensor = bme680.BME680(i2c_addr=address)
 
-        # Combien de ms le detecteur de gas chauffe avant de faire la detection
-        # La temperature que le detecteur doit atteindre en Celsius
-        sensor.set_gas_heater_profile(150, 320)
+    def __init__(self) -> None:
+        self._sensors: dict[tuple[int, int], bme680.BME680] = {}    # (bus, address) -> sensor
 
-        _sensor = sensor
+    def _ensure_sensor(self, bus: int = 1, address: int = 0x76) -> bme680.BME680:
+        """
+        Initialize the BME680/BME688 sensor if needed and return it.
+        """
+        sensor = self._sensors.get((bus, address))
+        if sensor is None:
+            # Bus I2C partage avec les autres capteurs: on garde le lock pendant l'init
+            i2c = get_bus(bus)
+            with i2c.lock:
+                sensor = bme680.BME680(i2c_addr=address, i2c_device=i2c.smbus)
 
-    return _sensor
+                # Combien de ms le detecteur de gas chauffe avant de faire la detection
+                # La temperature que le detecteur doit atteindre en Celsius
+                sensor.set_gas_heater_profile(150, 320)
 
+            self._sensors[(bus, address)] = sensor
 
-def read_bme(bus: int = 1, address: int = 0x76) -> dict[str, float | None] | None:
-    """
-    Read temperature, relative humidity, pressure, and gas resistance.
+        return sensor
 
-    Args:
-        bus: I2C bus number (ignored here; we always use /dev/i2c-1).
-        address: I2C address (0x76 or 0x77).
+    def read(self, bus: int = 1, address: int = 0x76) -> dict[str, float | None] | None:
+        """
+        Read temperature, relative humidity, pressure, and gas resistance.
+
+        Args:
+            bus: I2C bus number.
+            address: I2C address (0x76 or 0x77).
+
+        Returns:
+            dict with keys: temp_c, rh_pct, pressure_hpa, voc_ohm
+            or None if no new data is available.
+        """
+
+        # TODO: Enlever le try except et tenter de comprendre quelles erreures arrivent
+        try:
+            sensor = self._ensure_sensor(bus=bus, address=address)
+
+            with get_bus(bus).lock: # smbus2 n'est pas thread-safe et le SO2 est sur le meme bus
+                fresh = sensor.get_sensor_data()
+
+            if fresh:
+                data = sensor.data
+                temp_c = data.temperature
+                rh_pct = data.humidity
+                pressure_hpa = data.pressure
+
+                # Record VOC resistance even if not heat-stable yet
+                # TODO: Verifier data.heat_stable pour voir si la temperature du capteur de gas est arrive a la temperature voulue
+                voc_ohm = data.gas_resistance
+
+                return {
+                    "temp_c": temp_c,
+                    "rh_pct": rh_pct,
+                    "pressure_hpa": pressure_hpa,
+                    "voc_ohm": voc_ohm,
+                }
+
+            # No new sample at this instant
+            return None
+
+        except Exception as e:
+            # In production we'll log this; for now we just print.
+            print(f"[BME] Error reading sensor at 0x{address:02x}: {e}")
+            return None
 
-    Returns:
-        dict with keys: temp_c, rh_pct, pressure_hpa, voc_ohm
-        or None if no new data is available.
-    """
 
-    # TODO: Enlever le try except et tenter de comprendre quelles erreures arrivent
-    try:
-        sensor = _ensure_sensor(address=address)
-
-        if sensor.get_sensor_data():
-            data = sensor.data
-            temp_c = data.temperature
-            rh_pct = data.humidity
-            pressure_hpa = data.pressure
-
-            # Record VOC resistance even if not heat-stable yet
-            # TODO: Verifier data.heat_stable pour voir si la temperature du capteur de gas est arrive a la temperature voulue
-            voc_ohm = data.gas_resistance
-
-            return {
-                "temp_c": temp_c,
-                "rh_pct": rh_pct,
-                "pressure_hpa": pressure_hpa,
-                "voc_ohm": voc_ohm,
-            }
-
-        # No new sample at this instant
-        return None
-
-    except Exception as e:
-        # In production we'll log this; for now we just print.
-        print(f"[BME] Error reading sensor at 0x{address:02x}: {e}")
-        return None
+# Same API as before: read_bme(bus, address) backed by a single shared reader.
+read_bme = BMEReader().read
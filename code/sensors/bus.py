@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Shared I2C bus handles for the sensors on the node.
+
+The BME688 and the SO2 sensor sit on the same I2C bus and are read from
+the collector's worker threads. smbus2 handles are not thread-safe, so
+every sensor goes through get_bus(), which returns one SharedBus per bus
+number: a single open SMBus plus the lock to hold around each transaction.
+Each reader takes the lock around its own reads; there is no combined
+read of all the sensors under one acquisition.
+"""
+
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass, field
+
+try:
+    import smbus2 as smbus
+except ImportError:
+    import smbus
+
+
+@dataclass
+class SharedBus:
+    number: int
+    smbus: smbus.SMBus
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+_buses: dict[int, SharedBus] = {}
+_buses_lock = threading.Lock()
+
+
+def get_bus(bus: int = 1) -> SharedBus:
+    """Return the shared handle for /dev/i2c-<bus>, opening it on first use."""
+    with _buses_lock:
+        shared = _buses.get(bus)
+        if shared is None:
+            shared = _buses[bus] = SharedBus(number=bus, smbus=smbus.SMBus(bus))
+        return shared
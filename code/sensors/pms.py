@@ -16,6 +16,15 @@ import time
 import serial
 import struct
 
+# Somme des 2 bytes de header (0x42 + 0x4D), incluse dans le checksum de chaque frame
+_HEADER_SUM = 0x42 + 0x4D
+_HEADER = b"\x42\x4D"
+_FRAME_LEN = 32 # 2 bytes de header + 30 bytes d'informations
+
+# Les 30 bytes apres le header, en big endian: longueur, data 1 a data 13, checksum
+# Compile une seule fois; fields[N] est donc "data N"
+_FRAME = struct.Struct(">H13HH")
+
 
 class PMSReader:
     def __init__(self, port: str, baudrate: int = 9600, timeout: float = 0.5):
@@ -23,6 +32,7 @@ class PMSReader:
         self.baudrate = baudrate
         self.timeout = timeout
         self._ser: serial.Serial | None = None
+        self._rx = b"" # Bytes deja lus du stream serial mais pas encore utilises
 
     def open(self) -> None:
         if self._ser is None or not self._ser.is_open: # Si le stream serial est ferme, ouvre le
@@ -36,6 +46,7 @@ class PMSReader:
         if self._ser is not None and self._ser.is_open: # Si le stream serial est ouvert, ferme le
             self._ser.close()
             self._ser = None
+        self._rx = b""
 
     def _read_frame(self) -> dict[str, int] | None:
         self.open()
@@ -44,36 +55,43 @@ class PMSReader:
             return None
 
         # Sync to header 0x42 0x4D
-        while True: # Passe a travers des donnees dans le serial bus
-            b = ser.read(1) # Lit la premiere byte dans le stream serial
-            if not b:
+        buf = self._rx
+        idx = buf.find(_HEADER) # Cherche le header dans les bytes deja lus
+        while idx < 0: # Passe a travers des donnees dans le serial bus
+            # Lit tout ce qui attend dans le stream serial d'un coup (au moins 2 bytes, la taille du header)
+            chunk = ser.read(max(2, ser.in_waiting))
+            if not chunk:
+                self._rx = buf[-1:] # Garde le dernier byte, qui pourrait etre la premiere moitie du header
                 return None # Si aucune byte, ca veut dire qu'on a pas recu d'infos depuis la derniere fois qu'on a lu
-            # Si on est rendu au chunk d'informations publiees dans le stream serial
-            if b == b"\x42": # Regarde si on est rendu au premier byte de header
-                if ser.read(1) == b"\x4D": # Regarde si on est rendu au deuxieme byte du header
-                    break # Youpi! On a trouve les informations
+            buf = buf[-1:] + chunk # Le header pourrait etre coupe entre 2 lectures
+            idx = buf.find(_HEADER) # Youpi si idx >= 0! On a trouve les informations
+
+        missing = idx + _FRAME_LEN - len(buf)
+        if missing > 0:
+            buf += ser.read(missing) # Lit en une seule fois les bytes d'informations des sensors qui manquent
 
-        rest = ser.read(30) # Lit les 30 bytes d'informations des sensors
+        rest = buf[idx + 2:idx + _FRAME_LEN] # Les 30 bytes d'informations des sensors, sans le header
+        self._rx = buf[idx + _FRAME_LEN:] # Garde les bytes qui suivent la frame pour la prochaine lecture
         if len(rest) != 30: # Verifie si les donnees ont etes entrees correctement dans le stream serial
             return None
 
-        length = struct.unpack(">H", rest[0:2])[0] # Recupere les 3e et 4e bytes de metadonnees et les parse en big endian les 2 bytes
+        fields = _FRAME.unpack(rest) # Decode toute la frame en un seul appel
+
+        length = fields[0] # Les 3e et 4e bytes de metadonnees: la longueur des donnees
         if length != 28: # Verifie si elle affirme que la longueur des donnees est ce a quoi on s'attend
             return None
 
-        data_bytes = rest[:-2] # Recupere toutes les donnees sans prendre le checksum a la fin
-        checksum_recv = struct.unpack(">H", rest[-2:])[0] # Recupere le checksum et decode les 2 bytes en big endian 
+        checksum_recv = fields[14] # Le checksum a la fin de la frame
 
-        checksum_calc = (0x42 + 0x4D + sum(data_bytes)) & 0xFFFF # Additionne toutes les bytes des donnees pour faire une sorte de checksum, et reduit le nombre a 2 byte si il est plus grand que 2 byte
+        # Additionne toutes les bytes des donnees (sans les 2 bytes du checksum a la fin) pour faire une sorte de checksum, et reduit le nombre a 2 byte si il est plus grand que 2 byte
+        checksum_calc = (_HEADER_SUM + sum(rest) - rest[28] - rest[29]) & 0xFFFF
         if checksum_calc != checksum_recv: # Verifie si la metadonnee est egale au checksum calcule
             return None
 
-        vals = struct.unpack(">13H", rest[2:2+26]) # Recupere toutes les valeurs interessantes, du data 1 au data 13 en big endian
-
         return {
-            "pm1": vals[3], # Recupere la valeur de la concentration de pm 1 dans data 4
-            "pm25": vals[4], # Recupere la valeur de la concentration de pm 2.5 dans data 5
-            "pm10": vals[5], # Recupere la valeur de la concentration de pm 10 dans data 6
+            "pm1": fields[4], # Recupere la valeur de la concentration de pm 1 dans data 4
+            "pm25": fields[5], # Recupere la valeur de la concentration de pm 2.5 dans data 5
+            "pm10": fields[6], # Recupere la valeur de la concentration de pm 10 dans data 6
         }
 
     def read(self, window_seconds: float = 0.4) -> dict[str, int] | None:
@@ -3,25 +3,45 @@
 SO2 sensor reader (DFRobot Gravity calibrated SO2, I2C, address 0x74)
 
 SAFETY-FIRST version:
-- Does NOT use i2c_rdwr command frames (those can wedge the bus if timing is off)
+- Does NOT send DFRobot command frames (those can wedge the bus if timing is off).
+  The only i2c_rdwr use is the plain register read: write the 0x00 pointer,
+  repeated START, read the frame, in one combined transaction.
 - Does NOT loop or retry aggressively
 - Does ONE quick attempt per call and returns stable columns every time
 - Rate limits reads so we don't hammer I2C
+- init_so2() samples on a background thread at that rate, so read_so2()
+  never waits on the bus
 
-Stable output keys (match your daily CSV columns):
+read_so2() returns an SO2Row whose fields match the daily CSV columns:
   - so2_ppm
   - so2_raw
   - so2_byte0
   - so2_byte1
-  - so2_error   ("OK" if no error; otherwise NO_FRAME / exception)
+  - so2_error   ("OK" if no error; "CACHED" if the last good frame was
+                 reused because of the rate limit; otherwise NO_FRAME /
+                 BAD_CHECKSUM / BAD_FRAME / exception)
   - so2_status  ("ok" or "error")
 
 Note:
-This assumes the device exposes a “latest frame” via register 0x00 (8 bytes),
-which matches your earlier working behavior.
+This assumes the device exposes a “latest frame” via register 0x00,
+which matches your earlier working behavior. The full 9-byte frame is read
+(start byte, command, concentration high/low, gas type, decimals,
+temperature high/low, checksum) so the checksum can be verified; a frame
+corrupted on the bus is rejected as BAD_CHECKSUM instead of producing a
+garbage ppm. Temperature bytes 6-7 are transferred but not used.
 If it needs a command frame to update, do that ONLY in a dedicated test script,
 not in the always-on collector.
 
+Bus speed:
+A read is bus-bound (address + pointer + frame bytes), and the Raspberry Pi
+default is 100 kHz. The sensor supports Fast-mode, so run the bus at 400 kHz
+by adding this line to /boot/config.txt (/boot/firmware/config.txt on
+recent images) and rebooting:
+
+    dtparam=i2c_arm_baudrate=400000
+
+init_so2() logs the clock the bus is actually running at.
+
 For more informations, please check:
 https://wiki.dfrobot.com/SKU_SEN0465toSEN0476_Gravity_Gas_Sensor_Calibrated_I2C_UART
 https://dfimg.dfrobot.com/nobody/wiki/5953b463b8712f03d0791e98dd592e78.pdf
@@ -30,129 +50,322 @@ https://dfimg.dfrobot.com/nobody/wiki/5953b463b8712f03d0791e98dd592e78.pdf
 from __future__ import annotations
 
 import logging
+import struct
+import threading
 import time
+from dataclasses import dataclass, replace
+from pathlib import Path
 
 try:
-    import smbus2 as smbus
+    from smbus2 import i2c_msg
 except ImportError:
-    import smbus
+    i2c_msg = None # python-smbus has no i2c_rdwr; fall back to read_i2c_block_data
+
+from sensors.bus import get_bus
+
+_log = logging.getLogger(__name__)
 
 I2C_BUS = 1
 DEFAULT_ADDR = 0x74 # Adresse du sensor dans le i2c bus
 
-_bus = None
-_addr = DEFAULT_ADDR
+# Register holding the latest frame, and bytes read from it: one full frame, checksum included
+_REG0 = 0x00
+_READ_LEN = 9
+
+# Concentration: unsigned 16 bits big endian at bytes 2-3
+_U16BE = struct.Struct(">H")
+
+# Frame header: start byte 0xFF then the command byte, checked together on
+# the first 4 bytes read as one unsigned 32 bits big endian (bytes 2-3 masked out)
+_U32BE = struct.Struct(">I")
+_HDR_MASK = 0xFFFF0000
+_HDR_86 = 0xFF860000
+_HDR_78 = 0xFF780000
+
+# Multiplier for the concentration, indexed by the decimals byte (0, 1 or 2 decimals)
+_SCALE = (1.0, 0.1, 0.01)
 
 # ---- safety knobs ----
 MIN_READ_INTERVAL_S = 1.0     # don't read more often than this
-_last_read_monotonic = 0.0
+_MIN_INTERVAL_NS = int(MIN_READ_INTERVAL_S * 1_000_000_000) # Meme intervalle en ns entiers, pour comparer avec time.monotonic_ns()
 
+# so2_status / so2_error values
+_OK = "ok"
+_ERR = "error"
+_ERR_NONE = "OK"
+_RL = "RATE_LIMIT"
+_CACHED = "CACHED"
+_NO_FRAME = "NO_FRAME"
+_BAD_FRAME = "BAD_FRAME"
+_BAD_CHECKSUM = "BAD_CHECKSUM"
 
-def init_so2(bus: int = I2C_BUS, address: int = DEFAULT_ADDR) -> None:
-    """Initialize the I2C bus and remember the SO2 address. Safe to call multiple times."""
-    global _bus, _addr
-    _addr = address
-    if _bus is None:
-        _bus = smbus.SMBus(bus)
+@dataclass(frozen=True, slots=True)
+class SO2Row:
+    """
+    One SO2 result. Every field has a value, so the CSV columns are never
+    blank; frozen, so the same row can be shared without copying.
+    """
+    so2_ppm: float | str = "NODATA"
+    so2_raw: int | str = "NODATA"
+    so2_byte0: int | str = "NODATA"
+    so2_byte1: int | str = "NODATA"
+    so2_error: str = _ERR_NONE
+    so2_status: str = _OK
 
 
-def _read8_from_reg0() -> list[int] | None:
-    """Read 8 bytes from register 0x00; return list of ints or None."""
-    global _bus, _addr
-    if _bus is None:
-        init_so2()
+# Returned when a read is skipped by the rate limiter and there is no good frame to reuse
+_RATE_LIMIT_ROW = SO2Row(so2_error=_RL, so2_status=_ERR)
+
+
+def _bus_clock_hz(bus: int) -> int | None:
+    """Return the I2C clock of the bus from the device tree, or None if unknown."""
+    # Sur un Pi, la frequence est un entier 32 bits big endian dans le device tree
+    path = Path(f"/sys/class/i2c-adapter/i2c-{bus}/of_node/clock-frequency")
+    try:
+        return int.from_bytes(path.read_bytes()[:4], "big")
+    except OSError:
+        return None
+
 
-    # One fast read, no retries
-    # Lit le 8 bytes du bloc de donnees contenu dans le register 0
-    data: list[int] = _bus.read_i2c_block_data(_addr, 0x00, 8)
-    if data and len(data) == 8: # Verifie si on a bel et bien recupere 8 bytes
-        return data
-    
-    return None
+def _checksum_ok(data: bytes) -> bool:
+    """
+    Datasheet checksum: byte8 == (invert(byte1 + ... + byte7) + 1), on 8 bits.
+    """
+    if len(data) < 9:
+        return False
+    return ((~sum(data[1:8]) + 1) & 0xFF) == data[8] # sum() sur une slice de bytes: boucle en C
 
 
-def _parse_frame(data: list[int]) -> dict[str, float | int] | None:
+def _make_parser():
     """
-    Parse FF 86 / FF 78 style frames if present.
-    We only use bytes 2-3 as raw and convert to ppm conservatively.
+    Build _parse_frame with the frame constants bound as closure variables,
+    so a parse reads them as locals of the enclosing scope instead of
+    looking them up in the module globals on every call.
     """
-    # FIXME: Verifier 9 bytes, et calculer le checksum
-    if len(data) < 6: # Verifie si on a au moins 6 bytes d'informations, en comptant le start byte
-        return None
-    if data[0] != 0xFF: # Si le premier byte n'est pas 0xFF, qui est le "start byte", donc le byte qui signifie le debut d'un message
-        return None
-    # FIXME: Only check for 0x86 (gas reading), as 0x78 is unwanted/unneeded, because it doesn't return gas data
-    if data[1] not in (0x86, 0x78): # Regarde si c'est une commande recuperation de donnees sur le SO2
-        return None
+    HDR_MASK = _HDR_MASK
+    HDR_86 = _HDR_86
+    HDR_78 = _HDR_78
+    SCALE = _SCALE
+    N_SCALE = len(_SCALE)
+    unpack_u16be = _U16BE.unpack_from
+    unpack_u32be = _U32BE.unpack_from
+
+    def parse_frame(data: bytes) -> SO2Row | None:
+        """
+        Parse FF 86 / FF 78 style frames if present.
+        We only use bytes 2-3 as raw and convert to ppm conservatively.
+        """
+        # Le checksum est verifie avant par _checksum_ok
+        if len(data) < 6: # Verifie si on a au moins 6 bytes d'informations, en comptant le start byte
+            return None
+        # Le premier byte doit etre 0xFF, le "start byte" qui signifie le debut d'un message,
+        # et le deuxieme une commande de recuperation de donnees sur le SO2: les deux en une comparaison
+        # FIXME: Only check for 0x86 (gas reading), as 0x78 is unwanted/unneeded, because it doesn't return gas data
+        hdr = unpack_u32be(data)[0] & HDR_MASK
+        if hdr != HDR_86 and hdr != HDR_78:
+            return None
 
-    b0 = data[2] # Recupere le high byte du nombre de la concentration de SO2
-    b1 = data[3] # Recupere le low byte du nombre de la concentration de SO2
-    raw = (b0 << 8) | b1 # Byte shift le high byte de 8 positions (x256) et y additionne le low byte
+        raw = unpack_u16be(data, 2)[0] # Decode le high byte et le low byte de la concentration de SO2 (big endian) en un seul appel
 
-    # If decimals exist in byte5 (your tests showed dec=1 often), apply it.
-    dec = data[5] # Lit le 5e byte, qui dit ou se trouve la decimale dans le "raw", le chiffre qui represente la concentration en ppm
-    scale = {0: 1.0, 1: 0.1, 2: 0.01}.get(dec, 1.0) # En fonction du 5e byte, on choisie un nombre avec lequel multiplier le chiffre qui provient des byte2 et byte3
-    ppm = float(raw) * scale # Place la virgule dans le chiffre de concentration
+        # If decimals exist in byte5 (your tests showed dec=1 often), apply it.
+        dec = data[5] # Lit le 5e byte, qui dit ou se trouve la decimale dans le "raw", le chiffre qui represente la concentration en ppm
+        scale = SCALE[dec] if dec < N_SCALE else 1.0 # En fonction du 5e byte, on choisie un nombre avec lequel multiplier le chiffre qui provient des byte2 et byte3
+        ppm = float(raw) * scale # Place la virgule dans le chiffre de concentration
 
-    # TODO: Verifier pourquoi on garde pas juste so2_ppm
-    # TODO: Verifier pourquoi on regarde pas le type de gas avec byte4 et la temperature avec byte6 high et byte7 low
-    return {
-        "so2_ppm": ppm,
-        "so2_raw": raw,
-        "so2_byte0": b0,
-        "so2_byte1": b1,
-    }
+        # TODO: Verifier pourquoi on garde pas juste so2_ppm
+        # TODO: Verifier pourquoi on regarde pas le type de gas avec byte4 et la temperature avec byte6 high et byte7 low
+        return SO2Row(
+            so2_ppm=ppm,
+            so2_raw=raw,
+            so2_byte0=data[2], # Le high byte du nombre de la concentration de SO2
+            so2_byte1=data[3], # Le low byte du nombre de la concentration de SO2
+        )
 
+    return parse_frame
 
-def read_so2() -> dict[str, float | int | str]:
+
+_parse_frame = _make_parser()
+
+
+class SO2Reader:
     """
-    Safety-first read:
-    - rate limited
-    - one quick read
-    - never blank columns
+    One DFRobot SO2 sensor on an I2C bus.
+
+    The bus handle is the shared one from sensors.bus (the BME688 is on the
+    same bus); the address, rate limiter and last good result live on the
+    instance, so read() does not touch module globals. After
+    start_polling(), a daemon thread samples the sensor and read() only
+    hands out its latest result.
     """
-    global _last_read_monotonic # Garde le temps de la derniere lecture
-
-    result: dict[str, float | int | str] = {
-        "so2_ppm": "NODATA",
-        "so2_raw": "NODATA",
-        "so2_byte0": "NODATA",
-        "so2_byte1": "NODATA",
-        "so2_error": "OK",
-        "so2_status": "ok",
-    }
-
-    # rate limit
-    now = time.monotonic() # Utilise cette sorte de timer parce qu'on a pas besoin d'un vrai temps, seulement d'un temps en seconde qui augmente toujours. Cette horloge se fout de l'horloge interne de l'ordi
-    if (now - _last_read_monotonic) < MIN_READ_INTERVAL_S: # Eviter de lire trop souvent
+
+    def __init__(self, bus: int = I2C_BUS, address: int = DEFAULT_ADDR):
+        shared = get_bus(bus)
+        # Methodes du bus liees une seule fois: pas de lookup d'attribut sur le SMBus a chaque lecture
+        if i2c_msg is not None:
+            self._i2c_rdwr = shared.smbus.i2c_rdwr
+        else:
+            self._read_block = shared.smbus.read_i2c_block_data # python-smbus n'a pas de i2c_rdwr
+        self._lock = shared.lock
+        self.set_address(address)
+        self._last_read_monotonic_ns = 0
+        self._last_result: SO2Row | None = None # Last good result, reused when rate limited
+
+        # Polling en arriere-plan (start_polling): dernier resultat publie par le thread
+        self._latest: SO2Row | None = None
+        self._latest_fresh = False # Vrai tant que read() n'a pas encore rendu _latest
+        self._latest_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        hz = _bus_clock_hz(bus)
+        if hz is None:
+            _log.info(f"SO2: I2C bus {bus} clock unknown")
+        elif hz < 400_000:
+            _log.info(f"SO2: I2C bus {bus} at {hz // 1000} kHz; set dtparam=i2c_arm_baudrate=400000 for faster reads")
+        else:
+            _log.info(f"SO2: I2C bus {bus} at {hz // 1000} kHz")
+
+    def set_address(self, address: int) -> None:
+        """Point the reader at another I2C address."""
+        with self._lock: # Le thread de polling peut etre en train de lire
+            self._addr = address
+            if i2c_msg is not None:
+                # Messages construits une seule fois: la lecture reutilise le meme buffer ctypes a chaque appel
+                self._msg_w = i2c_msg.write(address, [_REG0])
+                self._msg_r = i2c_msg.read(address, _READ_LEN)
+
+    def _read_from_reg0(self) -> bytes | None:
+        """Read _READ_LEN bytes from register 0x00; return them or None."""
+        # One fast read, no retries
+        # Lit les _READ_LEN bytes du bloc de donnees contenu dans le register 0
+        with self._lock: # smbus2 n'est pas thread-safe et le BME est sur le meme bus
+            if i2c_msg is not None:
+                # Ecrit le pointeur de register puis lit, dans une seule transaction I2C (repeated START)
+                self._i2c_rdwr(self._msg_w, self._msg_r)
+                data = bytes(self._msg_r)
+            else:
+                data = bytes(self._read_block(self._addr, _REG0, _READ_LEN))
+        if data and len(data) == _READ_LEN: # Verifie si on a bel et bien recupere tous les bytes
+            return data
+
+        return None
+
+    def start_polling(self) -> None:
+        """
+        Sample the sensor every MIN_READ_INTERVAL_S on a daemon thread;
+        read() then returns the latest sample without touching the bus.
+        """
+        if self._thread is not None:
+            return
+        self._publish(self._sample()) # Premier echantillon tout de suite: read() a toujours un resultat
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._poll_loop, name="so2-poll", daemon=True)
+        self._thread.start()
+
+    def stop_polling(self) -> None:
+        """Stop the polling thread; read() goes back to sampling on the caller's thread."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _poll_loop(self) -> None:
+        # wait() sert de sleep, mais se reveille tout de suite quand on demande l'arret
+        while not self._stop.wait(MIN_READ_INTERVAL_S):
+            self._publish(self._sample())
+
+    def _publish(self, result: SO2Row) -> None:
+        with self._latest_lock:
+            self._latest = result
+            self._latest_fresh = True
+            self._remember(result)
+
+    def _remember(self, result: SO2Row) -> None:
+        # Le cache ne vaut que jusqu'a la prochaine lecture, reussie ou non
+        self._last_result = result if result.so2_status == _OK else None
+
+    def _stale(self) -> SO2Row:
+        """Result for a read() that did not get a new sample."""
         # Not an error; we just didn't sample this time
-        result["so2_status"] = "error"
-        result["so2_error"] = "RATE_LIMIT"
-        return result
-    
-    # Enregistre le temps de lecture pour faire du rate limit au besoin
-    _last_read_monotonic = now
+        # Redonne la derniere frame valide (lue il y a moins de MIN_READ_INTERVAL_S) plutot qu'une ligne vide
+        if self._last_result is not None:
+            return replace(self._last_result, so2_error=_CACHED)
+        return _RATE_LIMIT_ROW
 
-    try:
-        data = _read8_from_reg0() # Recupere les 9 bytes d'infos "raw" sur la quantite de SO2
-        if not data: # Si on a pas reussi a recuperer les donnees
-            result["so2_status"] = "error"
-            result["so2_error"] = "NO_FRAME"
-            return result
-
-        parsed = _parse_frame(data) # Recupere le ppm apres avoir ete traite
-        if not parsed: # Si le ppm n'a pas pu etre extrait
-            result["so2_status"] = "error"
-            result["so2_error"] = "BAD_FRAME"
-            return result
-
-        result.update(parsed) # Update le dict result avec les nouvelles donnees
-        result["so2_error"] = "OK"
-        result["so2_status"] = "ok"
+    def read(self) -> SO2Row:
+        """
+        Safety-first read:
+        - rate limited, or served from the polling thread's latest sample
+        - one quick read
+        - never blank columns
+        """
+        if self._thread is not None:
+            # Le thread de polling lit le capteur: ici on ne fait que recuperer son dernier resultat
+            with self._latest_lock:
+                if self._latest_fresh:
+                    self._latest_fresh = False
+                    return self._latest
+                return self._stale()
+
+        # rate limit (checked first: the skipped read needs no dict to be built)
+        now = time.monotonic_ns() # Utilise cette sorte de timer parce qu'on a pas besoin d'un vrai temps, seulement d'un temps (en ns, entier) qui augmente toujours. Cette horloge se fout de l'horloge interne de l'ordi
+        if (now - self._last_read_monotonic_ns) < _MIN_INTERVAL_NS: # Eviter de lire trop souvent
+            return self._stale()
+
+        # Enregistre le temps de lecture pour faire du rate limit au besoin
+        self._last_read_monotonic_ns = now
+        result = self._sample()
+        self._remember(result)
         return result
 
-    except Exception as e:
-        logging.exception("Error reading SO2 sensor (safety-first)")
-        result["so2_status"] = "error"
-        result["so2_error"] = str(e)
-        return result
\ No newline at end of file
+    def _sample(self) -> SO2Row:
+        """One quick read of the sensor."""
+        try:
+            data = self._read_from_reg0() # Recupere les bytes d'infos "raw" sur la quantite de SO2
+            if not data: # Si on a pas reussi a recuperer les donnees
+                return SO2Row(so2_error=_NO_FRAME, so2_status=_ERR)
+
+            if not _checksum_ok(data): # Si la frame a ete corrompue sur le bus
+                return SO2Row(so2_error=_BAD_CHECKSUM, so2_status=_ERR)
+
+            parsed = _parse_frame(data) # Recupere le ppm apres avoir ete traite, so2_error "OK" et so2_status "ok"
+            if not parsed: # Si le ppm n'a pas pu etre extrait
+                return SO2Row(so2_error=_BAD_FRAME, so2_status=_ERR)
+
+            return parsed
+
+        except Exception as e:
+            # Full traceback only when DEBUG is on: an I2C error storm shouldn't format one per sample
+            _log.error("Error reading SO2 sensor (safety-first): %s", e, exc_info=_log.isEnabledFor(logging.DEBUG))
+            return SO2Row(so2_error=str(e), so2_status=_ERR)
+
+
+# Module-level API kept for the collector: one shared SO2Reader
+_reader: SO2Reader | None = None
+
+
+def init_so2(bus: int = I2C_BUS, address: int = DEFAULT_ADDR) -> None:
+    """
+    Initialize the I2C bus, remember the SO2 address and start polling the
+    sensor in the background. Safe to call multiple times.
+    """
+    global _reader
+    if _reader is None:
+        _reader = SO2Reader(bus=bus, address=address)
+    else:
+        _reader.set_address(address)
+    _reader.start_polling()
+
+
+def stop_so2() -> None:
+    """Stop the background polling started by init_so2()."""
+    if _reader is not None:
+        _reader.stop_polling()
+
+
+def read_so2() -> SO2Row:
+    """Read the shared SO2Reader (see SO2Reader.read), initialising it with defaults if needed."""
+    if _reader is None:
+        init_so2()
+    return _reader.read()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Rolling median over the last N values, updated incrementally.
+
+- RollingMedian(maxlen): append() a value, median() of the current window
+
+Uses two heaps (lower half as a max-heap, upper half as a min-heap) so that
+append is O(log n) and median is O(1), instead of sorting the window on
+every query. The window itself is a fixed-size ring buffer with a head
+index, preallocated to maxlen slots. Values leaving the window are
+deleted lazily: they are only popped from a heap once they reach its top.
+Buried ones can pile up, so both heaps are rebuilt from the ring buffer
+once they hold more than 2 * maxlen entries; the heaps and the pending
+deletions therefore never exceed about 2 * maxlen entries.
+"""
+
+from __future__ import annotations
+
+import heapq
+from typing import Dict, List, Optional
+
+
+class RollingMedian:
+    def __init__(self, maxlen: int):
+        if maxlen < 1:
+            raise ValueError("maxlen must be >= 1")
+        self.maxlen = maxlen
+        self._ring: List[float] = [0.0] * maxlen  # window, oldest at _head once full
+        self._head = 0                        # next slot to write in _ring
+        self._count = 0                       # values currently in the window
+        self._lo: List[float] = []            # lower half, negated (max-heap)
+        self._hi: List[float] = []            # upper half (min-heap)
+        self._lo_size = 0                     # live values in _lo
+        self._hi_size = 0                     # live values in _hi
+        self._deleted: Dict[float, int] = {}  # value -> pending lazy deletions
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, x: float) -> None:
+        """Add x to the window, evicting the oldest value if it is full."""
+        if self._count == self.maxlen:
+            self._remove(self._ring[self._head])
+        else:
+            self._count += 1
+
+        self._ring[self._head] = x
+        self._head = (self._head + 1) % self.maxlen
+        if not self._lo or x <= -self._lo[0]:
+            heapq.heappush(self._lo, -x)
+            self._lo_size += 1
+        else:
+            heapq.heappush(self._hi, x)
+            self._hi_size += 1
+        self._rebalance()
+        # Deleted values buried under live ones never reach a heap top (e.g. a rising trend)
+        if len(self._lo) + len(self._hi) > 2 * self.maxlen:
+            self._compact()
+
+    def median(self) -> Optional[float]:
+        """Median of the current window, or None if it is empty."""
+        if self._lo_size == 0:
+            return None
+        if (self._lo_size + self._hi_size) % 2:
+            return -self._lo[0]
+        return 0.5 * (-self._lo[0] + self._hi[0])
+
+    def _remove(self, x: float) -> None:
+        """Mark x as deleted; it is popped once it reaches the top of its heap."""
+        self._deleted[x] = self._deleted.get(x, 0) + 1
+        if x <= -self._lo[0]:
+            self._lo_size -= 1
+            if x == -self._lo[0]:
+                self._prune(self._lo, -1)
+        else:
+            self._hi_size -= 1
+            if x == self._hi[0]:
+                self._prune(self._hi, 1)
+        self._rebalance()
+
+    def _prune(self, heap: List[float], sign: int) -> None:
+        """Pop lazily deleted values sitting at the top of heap."""
+        while heap:
+            x = sign * heap[0]
+            count = self._deleted.get(x, 0)
+            if count == 0:
+                break
+            if count == 1:
+                del self._deleted[x]
+            else:
+                self._deleted[x] = count - 1
+            heapq.heappop(heap)
+
+    def _compact(self) -> None:
+        """Rebuild both heaps from the window, dropping every lazily deleted value."""
+        window = sorted(self._ring[:self._count])
+        k = (self._count + 1) // 2
+        # Reversed then negated: ascending, so already a valid heap (same for window[k:])
+        self._lo = [-x for x in reversed(window[:k])]
+        self._hi = window[k:]
+        self._lo_size = k
+        self._hi_size = self._count - k
+        self._deleted.clear()
+
+    def _rebalance(self) -> None:
+        """Keep _lo holding as many live values as _hi, or one more."""
+        if self._lo_size > self._hi_size + 1:
+            heapq.heappush(self._hi, -heapq.heappop(self._lo))
+            self._lo_size -= 1
+            self._hi_size += 1
+            self._prune(self._lo, -1)
+        elif self._lo_size < self._hi_size:
+            heapq.heappush(self._lo, -heapq.heappop(self._hi))
+            self._hi_size -= 1
+            self._lo_size += 1
+            self._prune(self._hi, 1)